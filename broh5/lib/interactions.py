@@ -3,13 +3,20 @@ This module links user interactions to the responses of the Broh5 software.
 """
 
 import os
+import io
+import time
+import base64
 import h5py
 import hdf5plugin
+try:
+    # Optimized slicing of Blosc2-compressed datasets, if installed
+    import b2h5py.auto
+except ImportError:
+    pass
 import numpy as np
 import matplotlib.pyplot as plt
-import matplotlib.patches as patches
-from matplotlib.lines import Line2D
-from nicegui import ui, events
+from PIL import Image
+from nicegui import ui, events, run
 import broh5.lib.rendering as re
 import broh5.lib.utilities as util
 from broh5.lib.rendering import GuiRendering, FilePicker, FileSaver
@@ -36,10 +43,47 @@ class GuiInteraction(GuiRendering):
         Current slice from a 3D dataset.
     current_slice : tuple or None
         Information about the current slice being displayed.
+    contrast : tuple or None
+        Color limits (vmin, vmax) of the displayed image and the zoomed ROI,
+        None if the contrast sliders are at defaults.
+    image_ranges : dict
+        Minimum and maximum values of cached slices, keyed the same as
+        slice_cache.
+    info_slice : tuple or None
+        Slice whose statistics and histogram are displayed.
     data_1d_2d : np.ndarray or None
         Current 1D or 2D data being displayed.
     timer : UI object
         To update the GUI in regular intervals.
+    state_changed : bool
+        True if the GUI state has changed since the last update.
+    slice_change_time : float
+        Time when the slice slider was last moved, used to defer reading
+        data until the slider stops.
+    hdf_files : dict
+        Opened HDF files, their versions (modification time and size), and
+        the versions of the linked files read through them, keyed by file
+        path. Files are kept open, without HDF5 file locking, to reuse their
+        chunk cache between updates.
+    data_shapes : dict
+        Shapes of displayed 3D datasets, keyed by (file path, HDF key).
+    slice_cache : dict
+        Recently displayed slices, keyed by (index, axis, file path, HDF key),
+        in the order of use.
+    main_svg : str or None
+        SVG of the main plot without overlays.
+    overlay : str or None
+        SVG element (line or box) drawn on top of the main plot.
+    profile_line : matplotlib.lines.Line2D or None
+        Line of the intensity profile plot.
+    zoom_image : matplotlib.image.AxesImage or None
+        Image of the zoomed ROI.
+    data_trans : matplotlib.transforms.Affine2D or None
+        Data-to-display transform of the displayed image.
+    inv_data_trans : matplotlib.transforms.Affine2D or None
+        Display-to-data transform of the displayed image.
+    y_max : float or None
+        Top y-limit of the displayed image, used to locate clicks.
 
     Methods
     -------
@@ -51,6 +95,12 @@ class GuiInteraction(GuiRendering):
         Open a file picker dialog to select a file.
     display_hdf_tree(str)
         Display the HDF file structure as an interactive tree.
+    expand_hdf_tree(ValueChangeEventArguments, UI object, str)
+        Load the children of expanded groups of the HDF tree.
+    get_hdf_file(str, str or None)
+        Get an opened HDF file object, open the file if not done yet.
+    close_hdf_files(str or None)
+        Close opened HDF file objects.
     disable_sliders()
         Disable and reset the sliders for 3D-data slicing.
     enable_ui_elements_3d_data()
@@ -63,6 +113,8 @@ class GuiInteraction(GuiRendering):
         Reset the minimum and maximum sliders for image contrast.
     display_3d_data(data_obj)
         Display a slice of a 3D dataset as an image.
+    display_image()
+        Display the current slice with the current contrast and color map.
     display_1d_2d_data(data_obj, "plot")
         Display 1D/2D data as a plot or table.
     show_data()
@@ -86,20 +138,46 @@ class GuiInteraction(GuiRendering):
         self.main_plot.on("click", self.mouse_handler)
         self.tab_one.on("click", self.__select_tab_one)
         self.tab_two.on("click", self.__select_tab_two)
+        self.main_slider.on_value_change(self.__mark_slice_changed)
+        for element in (self.min_slider, self.max_slider, self.axis_list,
+                        self.cmap_list, self.display_type, self.marker_list,
+                        self.enable_zoom, self.enable_profile):
+            element.on_value_change(self.__mark_state_changed)
+        self.state_changed = True
+        self.slice_change_time = 0.0
         self.current_state, self.image, self.image_norm = None, None, None
         self.columns, self.rows = None, None
         self.current_slice, self.data_1d_2d = None, None
+        self.contrast, self.image_ranges = None, {}
+        self.info_slice = None
+        # show_data is async. ui.timer awaits the coroutine before the next
+        # tick, so a tick never starts while the previous one is running.
         self.timer = ui.timer(re.UPDATE_RATE, lambda: self.show_data())
         self.selected_tab = 1
         self.last_folder = ""
-        self.fig, self.ax = None, None
-        self.ver_line, self.hor_line, self.draw_roi = None, None, None
+        self.fig, self.ax, self.image_artist = None, None, None
+        self.draw_key = None
+        self.main_svg, self.overlay = None, None
+        self.profile_line, self.zoom_image = None, None
+        self.data_trans, self.inv_data_trans, self.y_max = None, None, None
+        self.hdf_files = {}
+        self.data_shapes = {}
+        self.slice_cache = {}
+
+    def __mark_state_changed(self):
+        self.state_changed = True
+
+    def __mark_slice_changed(self):
+        self.state_changed = True
+        self.slice_change_time = time.monotonic()
 
     def __select_tab_one(self):
         self.selected_tab = 1
+        self.state_changed = True
 
     def __select_tab_two(self):
         self.selected_tab = 2
+        self.state_changed = True
 
     def __update_zoom_check_box(self):
         if (self.enable_zoom.value is True
@@ -111,82 +189,171 @@ class GuiInteraction(GuiRendering):
                 and self.enable_zoom.value is True):
             self.enable_zoom.set_value(False)
 
-    def __get_xy(self, x, y, ax):
+    def __get_xy(self, x, y):
         try:
-            xn, yn = ax.transData.inverted().transform((x, y))
+            xn, yn = self.inv_data_trans.transform((x, y))
             return xn, yn
         except Exception as e:
             return None, None
 
+    # ui.matplotlib has no public API to get or set its SVG without
+    # re-rendering the figure. The two methods below depend on its internal
+    # "innerHTML" prop, which holds the SVG in the NiceGUI versions allowed by
+    # setup.py (>=1.4.21, <4). If it is missing, main_svg is None and the
+    # figure is always rendered in full, without overlays.
+    def __set_main_svg(self, svg):
+        # Update the displayed SVG directly, without re-rendering the figure
+        self.main_plot._props["innerHTML"] = svg
+        ui.element.update(self.main_plot)
+
+    def __render_main_plot(self):
+        # Render the whole figure and keep its SVG for partial updates
+        self.overlay = None
+        self.main_plot.update()
+        self.main_svg = self.main_plot._props.get("innerHTML")
+
+    def __update_svg_image(self):
+        # Replace the PNG image embedded in the SVG of the main plot, instead
+        # of re-rendering the whole figure when its layout is unchanged. The
+        # image is colored by the image artist and resized to its size on
+        # the figure, as matplotlib does.
+        rgba = self.image_artist.to_rgba(self.image_norm, bytes=True)
+        png_image = Image.fromarray(rgba[::-1])
+        bbox = self.image_artist.get_window_extent()
+        size = (max(1, round(bbox.width)), max(1, round(bbox.height)))
+        if png_image.size[0] > size[0]:
+            png_image = png_image.resize(size, Image.BILINEAR)
+        elif png_image.size[0] < size[0]:
+            png_image = png_image.resize(size, Image.NEAREST)
+        buffer = io.BytesIO()
+        png_image.save(buffer, format="png", compress_level=1)
+        header = "data:image/png;base64,\n"
+        start = self.main_svg.find(header)
+        end = self.main_svg.find('"', start + len(header))
+        if start == -1 or end == -1:
+            # No inline PNG in the expected format, render the whole figure
+            self.__render_main_plot()
+            return
+        start += len(header)
+        self.main_svg = (self.main_svg[:start]
+                         + base64.b64encode(buffer.getvalue()).decode("ascii")
+                         + self.main_svg[end:])
+        self.__set_main_svg(self.main_svg)
+
+    def __to_svg_xy(self, x, y):
+        # Convert data coordinates of the main plot to SVG coordinates
+        (xd, yd) = self.data_trans.transform((x, y))
+        scale = 72.0 / self.fig.dpi
+        return xd * scale, (self.fig.bbox.height - yd) * scale
+
+    def __draw_overlay(self, x0, y0, x1, y1, shape="line"):
+        """
+        Draw a line or a box, given in data coordinates, on top of the SVG of
+        the main plot. Only the overlay is added, the image is not rendered
+        again.
+        """
+        if self.main_svg is None:
+            return
+        (x0, y0) = self.__to_svg_xy(x0, y0)
+        (x1, y1) = self.__to_svg_xy(x1, y1)
+        style = 'fill="none" stroke="{0}" stroke-width="{1}"'.format(
+            re.BOX_LINE_COLOR, re.BOX_LINE_WIDTH)
+        if shape == "line":
+            self.overlay = '<line x1="{0}" y1="{1}" x2="{2}" y2="{3}" ' \
+                           '{4}/>'.format(x0, y0, x1, y1, style)
+        else:
+            self.overlay = '<rect x="{0}" y="{1}" width="{2}" height="{3}" ' \
+                           '{4}/>'.format(min(x0, x1), min(y0, y1),
+                                          abs(x1 - x0), abs(y1 - y0), style)
+        index = self.main_svg.rfind("</svg>")
+        self.__set_main_svg(self.main_svg[:index] + self.overlay
+                            + self.main_svg[index:])
+
+    def __remove_overlays(self):
+        if self.overlay is not None:
+            self.overlay = None
+            if self.ax in self.fig.axes and self.main_svg is not None:
+                self.__set_main_svg(self.main_svg)
+
     def mouse_handler(self, e: events.MouseEventArguments):
         """
         Show the zoomed area around the mouse-clicked location or the
         intensity profile across the clicked location.
         """
+        enable_profile = self.enable_profile.value
         if self.image is not None and (
-                self.enable_profile.value or self.enable_zoom.value):
-            x, y = self.__get_xy(e.args['offsetX'], e.args['offsetY'], self.ax)
+                enable_profile or self.enable_zoom.value):
+            x, y = self.__get_xy(e.args['offsetX'], e.args['offsetY'])
             if x is not None:
                 (height, width) = self.image.shape
                 x = int(x)
-                y_max = self.ax.transData.inverted().transform(
-                    (0, self.ax.get_ylim()[-1]))[-1]
-                y = height - 1 - int(y) + int((y_max - height) / 2)
+                y = height - 1 - int(y) + int((self.y_max - height) / 2)
                 if width > x >= 0 and height > y >= 0:
                     zp_fig = self.zoom_profile_plot.figure
-                    zp_fig.clf()
-                    zp_fig.set_dpi(self.dpi)
-                    zp_ax = zp_fig.gca()
-                    if self.draw_roi is not None:
-                        self.draw_roi.remove()
-                    if self.ver_line is not None:
-                        self.ver_line.remove()
-                    if self.hor_line is not None:
-                        self.hor_line.remove()
-                    self.hor_line, self.ver_line = None, None
-                    self.draw_roi = None
-                    if self.enable_profile.value:
+                    if enable_profile:
                         if self.profile_list.value == "vertical":
-                            self.ver_line = Line2D([x, x],
-                                                   [-1, height + 1],
-                                                   color=re.BOX_LINE_COLOR,
-                                                   linewidth=\
-                                                       re.BOX_LINE_WIDTH)
-                            if self.ax is not None:
-                                self.ax.add_line(self.ver_line)
-                                list_data = self.image[:, x]
-                                zp_ax.plot(list_data)
-                                zp_ax.set_title(f"Profile at column: {x}")
+                            self.__draw_overlay(x, -0.5, x, height - 0.5)
+                            list_data = self.image[:, x]
+                            title = f"Profile at column: {x}"
+                        else:
+                            self.__draw_overlay(-0.5, y, width - 0.5, y)
+                            list_data = self.image[y]
+                            title = f"Profile at row: {y}"
+                        # Update the existing profile line if it is still
+                        # displayed, instead of rebuilding the figure.
+                        if (self.profile_line is not None
+                                and self.profile_line.axes in zp_fig.axes):
+                            zp_ax = self.profile_line.axes
+                            self.profile_line.set_data(
+                                np.arange(len(list_data)), list_data)
+                            zp_ax.relim()
+                            zp_ax.autoscale_view()
                         else:
-                            self.hor_line = Line2D([-1, width + 1], [y, y],
-                                                   color=re.BOX_LINE_COLOR,
-                                                   linewidth=\
-                                                       re.BOX_LINE_WIDTH)
-                            if self.ax is not None:
-                                self.ax.add_line(self.hor_line)
-                                list_data = self.image[y]
-                                zp_ax.plot(list_data)
-                                zp_ax.set_title(f"Profile at row: {y}")
-                        zp_ax.set_xlabel("Index")
-                        zp_ax.set_ylabel("Intensity")
+                            zp_fig.clf()
+                            zp_fig.set_dpi(self.dpi)
+                            zp_ax = zp_fig.gca()
+                            self.profile_line = zp_ax.plot(list_data)[0]
+                            zp_ax.set_xlabel("Index")
+                            zp_ax.set_ylabel("Intensity")
+                        zp_ax.set_title(title)
                         zp_fig.tight_layout()
-                        self.main_plot.update()
                     else:
                         if self.image_norm is not None:
                             val = self.zoom_list.value
                             zoom = int(val.replace("x", ""))
                             roi_img, x0, y0, size = \
-                                util.get_image_roi(x, y, self.image_norm,
+                                util.get_image_roi(x, y, self.image,
                                                    zoom=zoom)
-                            self.draw_roi = patches.Rectangle(
-                                (x0, y0), size, size,
-                                linewidth=re.BOX_LINE_WIDTH,
-                                edgecolor=re.BOX_LINE_COLOR,
-                                facecolor='none')
-                            self.ax.add_patch(self.draw_roi)
-                            self.main_plot.update()
-                            zp_ax.imshow(roi_img, cmap=self.cmap_list.value)
-                            zp_fig.tight_layout()
+                            self.__draw_overlay(x0, y0, x0 + size, y0 + size,
+                                                shape="box")
+                            extent = (-0.5, size - 0.5, size - 0.5, -0.5)
+                            # Update the existing ROI image if it is still
+                            # displayed, instead of rebuilding the figure.
+                            if (self.zoom_image is not None and
+                                    self.zoom_image.axes in zp_fig.axes):
+                                self.zoom_image.set_data(roi_img)
+                                self.zoom_image.set_cmap(
+                                    self.cmap_list.value)
+                                if self.contrast is None:
+                                    self.zoom_image.autoscale()
+                                else:
+                                    self.zoom_image.set_clim(*self.contrast)
+                                if tuple(self.zoom_image.get_extent()) \
+                                        != extent:
+                                    self.zoom_image.set_extent(extent)
+                                    zp_fig.tight_layout()
+                            else:
+                                zp_fig.clf()
+                                zp_fig.set_dpi(self.dpi)
+                                zp_ax = zp_fig.gca()
+                                self.zoom_image = zp_ax.imshow(
+                                    roi_img, cmap=self.cmap_list.value,
+                                    extent=extent)
+                                if self.contrast is not None:
+                                    self.zoom_image.set_clim(*self.contrast)
+                                zp_fig.tight_layout()
+                        else:
+                            zp_fig.clf()
                     self.zoom_profile_plot.update()
 
     def show_key(self, event: events.ValueChangeEventArguments, file_path):
@@ -201,6 +368,7 @@ class GuiInteraction(GuiRendering):
             self.hdf_value_display.set_text("")
         if file_path is not None:
             self.file_path_display.set_text(file_path)
+        self.state_changed = True
 
     async def pick_file(self) -> None:
         """To pick a file when click the button 'Select file' """
@@ -222,15 +390,20 @@ class GuiInteraction(GuiRendering):
             self.last_folder = os.path.dirname(file_path)
             config_data = {'last_folder': self.last_folder}
             util.save_config(config_data)
-            self.display_hdf_tree(file_path)
+            await self.display_hdf_tree(file_path)
 
-    def display_hdf_tree(self, file_path):
+    async def display_hdf_tree(self, file_path):
         """Display interactive tree structure of a hdf file"""
+        file_path = file_path.replace("\\", "/")
+        self.file_path_display.set_text(file_path)
+        self.hdf_key_display.set_text("")
+        self.state_changed = True
+        # Walk the file in a worker thread, so the UI stays responsive
+        hdf_dic = await run.io_bound(util.hdf_tree_to_dict, file_path,
+                                     re.MAX_TREE_NODES)
+        if hdf_dic is None:
+            return
         with self.tree_container:
-            file_path = file_path.replace("\\", "/")
-            self.file_path_display.set_text(file_path)
-            self.hdf_key_display.set_text("")
-            hdf_dic = util.hdf_tree_to_dict(file_path)
             if isinstance(hdf_dic, list):
                 tree_display = ui.card()
 
@@ -240,12 +413,16 @@ class GuiInteraction(GuiRendering):
                             self.reset()
                     else:
                         self.reset()
+                    self.close_hdf_files(file_path)
                     self.tree_container.remove(tree_display)
 
                 with tree_display.style("background-color: "
                                         + re.TREE_BGR_COLOR):
-                    ui.tree(hdf_dic, label_key="id", node_key="label",
-                            on_select=lambda e: self.show_key(e, file_path))
+                    tree = ui.tree(hdf_dic, label_key="id", node_key="label",
+                                   on_select=lambda e: self.show_key(
+                                       e, file_path),
+                                   on_expand=lambda e: self.expand_hdf_tree(
+                                       e, tree, file_path))
                     ui.button("Close file", on_click=lambda: close_file())
             else:
                 if isinstance(hdf_dic, str):
@@ -253,6 +430,91 @@ class GuiInteraction(GuiRendering):
                 else:
                     ui.notify("Input must be hdf, hdf5, nxs, or h5 format!")
 
+    def expand_hdf_tree(self, event: events.ValueChangeEventArguments, tree,
+                        file_path):
+        """
+        Load the children of expanded groups of the hdf tree which were not
+        loaded when displaying the tree.
+        """
+        updated = False
+        for hdf_key in event.value:
+            # Find the node by walking down its path
+            node = tree._props["nodes"][0]
+            if hdf_key != "/":
+                path = ""
+                for name in hdf_key.split("/"):
+                    path = f"{path}/{name}" if path else name
+                    node = next((child for child in node.get("children", [])
+                                 if child["label"] == path), None)
+                    if node is None:
+                        break
+            if node is None:
+                continue
+            children = node.get("children", [])
+            if len(children) == 1 and children[0]["label"] == hdf_key + "/":
+                branch = util.get_hdf_tree_branch(file_path, hdf_key,
+                                                  re.MAX_TREE_NODES)
+                if isinstance(branch, str):
+                    ui.notify(branch)
+                else:
+                    node["children"] = branch
+                    updated = True
+        if updated:
+            tree.update()
+
+    def get_hdf_file(self, file_path, hdf_key=None):
+        """
+        Get an opened hdf file object. The file is opened with a large chunk
+        cache and kept open until it is closed by users, so successive
+        slicing reuses decompressed chunks instead of reading them again from
+        disk. As the viewer only reads, the file is opened without HDF5 file
+        locking, so other processes can still write to it, e.g. while data
+        is being acquired. The file is opened again if it, or a file linked
+        to the given dataset (external link or virtual dataset), has been
+        modified since.
+        """
+        version = util.get_file_version(file_path)
+        (hdf_obj, last_version, linked_versions) = self.hdf_files.get(
+            file_path, (None, None, ()))
+        if hdf_obj and (version != last_version or util.get_file_versions(
+                path for (path, _) in linked_versions) != linked_versions):
+            # Forget the slice read from the old file
+            self.close_hdf_files(file_path)
+            self.current_slice = None
+            self.info_slice, self.draw_key = None, None
+            hdf_obj, linked_versions = None, ()
+        if not hdf_obj:
+            hdf_obj = h5py.File(file_path, "r", locking=False,
+                                rdcc_nbytes=re.CHUNK_CACHE_SIZE,
+                                rdcc_nslots=re.CHUNK_CACHE_SLOTS,
+                                rdcc_w0=re.CHUNK_CACHE_W0)
+        if hdf_key is not None:
+            # Track the linked files of the dataset to be read
+            linked_files = util.get_linked_files(hdf_obj, hdf_key)
+            linked_files.update(path for (path, _) in linked_versions)
+            if len(linked_files) > len(linked_versions):
+                linked_versions = util.get_file_versions(linked_files)
+        self.hdf_files[file_path] = (hdf_obj, version, linked_versions)
+        return hdf_obj
+
+    def close_hdf_files(self, file_path=None):
+        """Close an opened hdf file, or all opened files if no path given"""
+        if file_path is None:
+            file_paths = list(self.hdf_files.keys())
+        else:
+            file_paths = [file_path]
+        for path in file_paths:
+            (hdf_obj, _, _) = self.hdf_files.pop(path, (None, None, None))
+            if hdf_obj:
+                hdf_obj.close()
+            for data_key in [key for key in self.data_shapes
+                             if key[0] == path]:
+                del self.data_shapes[data_key]
+            for slice_key in [key for key in self.slice_cache
+                              if key[2] == path]:
+                del self.slice_cache[slice_key]
+                self.image_ranges.pop(slice_key, None)
+
     def disable_sliders(self):
         """Disable and reset values of sliders"""
         self.main_slider.set_value(0)
@@ -287,7 +549,6 @@ class GuiInteraction(GuiRendering):
         else:
             self.zoom_profile_plot.figure.clf()
             self.zoom_profile_plot.set_visibility(False)
-            self.image_norm = None
 
         # Disable other ui-components
         self.main_table.set_visibility(False)
@@ -330,6 +591,7 @@ class GuiInteraction(GuiRendering):
             self.hdf_key_display.set_text("")
             self.file_path_display.set_text("")
             self.hdf_value_display.set_text("")
+            self.state_changed = True
         self.axis_list.value = re.AXIS_LIST[0]
         self.cmap_list.value = re.CMAP_LIST[0]
         self.display_type.value = re.DISPLAY_TYPE[0]
@@ -347,6 +609,7 @@ class GuiInteraction(GuiRendering):
         self.disable_sliders()
         self.rows, self.columns = None, None
         self.image, self.image_norm, self.data_1d_2d = None, None, None
+        self.draw_key = None
         self.main_table.set_visibility(False)
         self.main_plot.set_visibility(True)
         self.zoom_profile_plot.set_visibility(False)
@@ -363,17 +626,18 @@ class GuiInteraction(GuiRendering):
         self.min_slider.set_value(0)
         self.max_slider.set_value(255)
 
-    def display_3d_data(self, data_obj):
+    async def display_3d_data(self, data_obj):
         """Display a slice of 3d array as an image"""
         self.enable_ui_elements_3d_data()
-        (depth, height, width) = data_obj.shape
+        axis = int(self.axis_list.value)
+        file_path = self.file_path_display.text
+        hdf_key = self.hdf_key_display.text
+        data_key = (file_path, hdf_key)
+        if data_key not in self.data_shapes:
+            self.data_shapes[data_key] = data_obj.shape
+        (depth, height, width) = self.data_shapes[data_key]
         current_max = self.main_slider._props["max"]
-        if int(self.axis_list.value) == 2:
-            max_val = width - 1
-        elif int(self.axis_list.value) == 1:
-            max_val = height - 1
-        else:
-            max_val = depth - 1
+        max_val = self.data_shapes[data_key][axis] - 1
         if current_max != max_val:
             self.main_slider._props["max"] = max_val
             self.main_slider.update()
@@ -381,50 +645,154 @@ class GuiInteraction(GuiRendering):
         if d_pos > max_val:
             self.main_slider.set_value(max_val)
             d_pos = max_val
-        new_slice = (self.main_slider.value, self.axis_list.value,
-                     self.file_path_display.text)
-        if new_slice != self.current_slice or self.image is None:
+        new_slice = (d_pos, axis, file_path, hdf_key)
+        if new_slice in self.slice_cache:
+            # Move the slice to the end to mark it as recently used
             self.current_slice = new_slice
-            if int(self.axis_list.value) == 2:
-                if depth > 1000 and height > 1000:
+            self.image = self.slice_cache.pop(new_slice)
+            self.slice_cache[new_slice] = self.image
+        elif new_slice != self.current_slice or self.image is None:
+            if axis == 2:
+                # Refused for large contiguous datasets, and for chunked
+                # datasets if the chunks of a slice don't fit in the chunk
+                # cache, e.g. a (1, height, width) chunk layout where each
+                # slice decompresses the whole volume.
+                read_size = util.get_chunk_read_size(data_obj, 2)
+                if read_size is None:
+                    refused = depth > 1000 and height > 1000
+                else:
+                    refused = read_size > re.CHUNK_CACHE_SIZE
+                if refused:
                     ui.notify("Slicing along axis 2 is very time-consuming!")
                     self.axis_list.value = 0
                     self.main_slider.set_value(0)
-                    self.image = data_obj[0]
+                    new_slice = (0, 0, file_path, hdf_key)
+                    read_slice = lambda: data_obj[0]
                 else:
-                    self.image = data_obj[:, :, d_pos]
-            elif int(self.axis_list.value) == 1:
+                    read_slice = lambda: data_obj[:, :, d_pos]
+            elif axis == 1:
                 if depth > 1000 and width > 1000:
                     ui.notify("Slicing along axis 1 can take time !")
-                self.image = data_obj[:, d_pos, :]
+                read_slice = lambda: data_obj[:, d_pos, :]
             else:
-                self.image = data_obj[d_pos]
+                read_slice = lambda: data_obj[d_pos]
+            # Read in a worker thread, so the UI stays responsive
+            image = await run.io_bound(read_slice)
+            # Discard the slice if the app is closing or another dataset
+            # has been selected in the meantime. Nothing is displayed, so
+            # clear the state to redisplay on the next update.
+            if image is None or data_key != (self.file_path_display.text,
+                                             self.hdf_key_display.text):
+                self.current_state = None
+                return
+            self.slice_cache[new_slice] = image
+            # Drop the least recently used slices if above the memory limit
+            while (len(self.slice_cache) > 1
+                   and sum(img.nbytes for img in self.slice_cache.values())
+                   > re.SLICE_CACHE_SIZE):
+                old_slice = next(iter(self.slice_cache))
+                del self.slice_cache[old_slice]
+                self.image_ranges.pop(old_slice, None)
+            # Latest wins: if users moved to another slice during the read,
+            # keep this one cached but only display the newest one.
+            if (int(self.main_slider.value) != new_slice[0]
+                    or int(self.axis_list.value) != new_slice[1]):
+                self.current_state = None
+                return
+            self.current_slice, self.image = new_slice, image
+        self.display_image()
+
+    def display_image(self):
+        """
+        Display the current slice using the values of the contrast sliders
+        and the color map, without reading data from the hdf file.
+        """
         min_val = int(self.min_slider.value)
         max_val = int(self.max_slider.value)
-        if min_val > 0 or max_val < 255:
-            if min_val >= max_val:
-                min_val = np.clip(max_val - 1, 0, 254)
-                self.min_slider.set_value(min_val)
-            nmin, nmax = np.min(self.image), np.max(self.image)
-            if nmax != nmin:
-                self.image_norm = np.uint8(
-                    255.0 * (self.image - nmin) / (nmax - nmin))
-                self.image_norm = np.clip(self.image_norm, min_val, max_val)
-            else:
-                self.image_norm = np.zeros(self.image.shape)
+        if (min_val > 0 or max_val < 255) and min_val >= max_val:
+            min_val = np.clip(max_val - 1, 0, 254)
+            self.min_slider.set_value(min_val)
+        # Skip redrawing if the image and its display settings are unchanged
+        # (e.g. only the tab or the zoom/profile options changed).
+        draw_key = (self.current_slice, min_val, max_val,
+                    self.cmap_list.value)
+        self.fig = self.main_plot.figure
+        if (draw_key == self.draw_key and self.image_artist is not None
+                and self.ax in self.fig.axes):
+            self.__remove_overlays()
         else:
-            self.image_norm = np.copy(self.image)
+            self.draw_key = draw_key
+            self.__draw_image(min_val, max_val)
+        self.__display_image_info()
 
-        self.fig = self.main_plot.figure
-        self.fig.clf()
-        self.fig.set_dpi(self.dpi)
-        self.ax = self.fig.gca()
-        self.ax.imshow(self.image_norm, cmap=self.cmap_list.value)
-        self.fig.tight_layout()
-        self.main_plot.update()
+    def __draw_image(self, min_val, max_val):
+        # Downsample images larger than twice the figure size in pixels for
+        # displaying, the full-size image is kept for saving, profile
+        # plotting, zooming, and statistics.
+        (height, width) = self.image.shape
+        fig_pixels = int(max(self.fig_size) * self.dpi)
+        step = max(1, max(height, width) // fig_pixels)
+        image_disp = self.image[::step, ::step]
+        if min_val > 0 or max_val < 255:
+            # Range of the full image, computed once per cached slice
+            if self.current_slice not in self.image_ranges:
+                self.image_ranges[self.current_slice] = (np.min(self.image),
+                                                         np.max(self.image))
+            (nmin, nmax) = self.image_ranges[self.current_slice]
+            # Color limits matching the slider values, matplotlib applies
+            # them when drawing, so the image isn't rescaled here.
+            scale = (float(nmax) - float(nmin)) / 255.0
+            clim = (float(nmin) + min_val * scale,
+                    float(nmin) + max_val * scale)
+        else:
+            clim = None
+        self.contrast = clim
+        self.image_norm = image_disp
+        extent = (-0.5, width - 0.5, height - 0.5, -0.5)
+        if self.image_artist is None or self.ax not in self.fig.axes:
+            self.fig.clf()
+            self.fig.set_dpi(self.dpi)
+            self.ax = self.fig.gca()
+            self.image_artist = self.ax.imshow(self.image_norm,
+                                               cmap=self.cmap_list.value,
+                                               extent=extent)
+            if clim is not None:
+                self.image_artist.set_clim(*clim)
+            self.fig.tight_layout()
+        else:
+            # Update the existing image in place instead of rebuilding the
+            # figure.
+            self.image_artist.set_data(self.image_norm)
+            self.image_artist.set_cmap(self.cmap_list.value)
+            if clim is None:
+                self.image_artist.autoscale()
+            else:
+                self.image_artist.set_clim(*clim)
+            if (tuple(self.image_artist.get_extent()) == extent
+                    and self.main_svg is not None):
+                # Same layout, only the embedded image needs updating
+                self.overlay = None
+                self.__update_svg_image()
+                return
+            self.image_artist.set_extent(extent)
+            self.fig.tight_layout()
+        # Transforms of the final layout, used when clicking on the image.
+        # The aspect is otherwise only applied when the figure is rendered.
+        self.ax.apply_aspect()
+        self.data_trans = self.ax.transData.frozen()
+        self.inv_data_trans = self.data_trans.inverted()
+        self.y_max = self.inv_data_trans.transform(
+            (0, self.ax.get_ylim()[-1]))[-1]
+        self.__render_main_plot()
 
-        if self.selected_tab == 2:
-            rows = util.format_statistical_info(self.image)[0]
+    def __display_image_info(self):
+        # Statistics and histogram only change with the slice
+        if self.selected_tab == 2 and self.info_slice != self.current_slice:
+            self.info_slice = self.current_slice
+            stats = util.get_statistics(self.image)
+            # Reuse the range when the contrast sliders are moved later
+            self.image_ranges.setdefault(self.current_slice, stats[:2])
+            rows = util.format_statistical_info(self.image, stats)[0]
             if self.image_info_table.rows is None:
                 self.image_info_table._props["rows"] = rows
             else:
@@ -432,26 +800,28 @@ class GuiInteraction(GuiRendering):
             self.image_info_table.update()
             with self.histogram_plot:
                 plt.clf()
-                flat_data = self.image.ravel()
-                num_bins = min(255, len(flat_data))
-                hist, bin_edges = np.histogram(flat_data, bins=num_bins)
-                plt.hist(bin_edges[:-1], bins=bin_edges, weights=hist,
-                         color='skyblue', edgecolor='black', alpha=0.65,
-                         label=f"Num bins: {num_bins}")
+                num_bins = min(255, self.image.size)
+                hist, bin_edges = util.get_histogram(self.image, num_bins,
+                                                     nmin=stats[0],
+                                                     nmax=stats[1])
+                plt.bar(bin_edges[:-1], hist, width=np.diff(bin_edges),
+                        align="edge", color='skyblue', edgecolor='black',
+                        alpha=0.65, label=f"Num bins: {num_bins}")
                 plt.title("Histogram")
                 plt.xlabel("Grayscale")
                 plt.ylabel("Frequency")
                 plt.legend()
-                self.histogram_plot.update()
 
     def display_1d_2d_data(self, data_obj, disp_type="plot"):
         """Display 1d/2d array as a table or plot"""
         self.enable_ui_elements_1d_2d_data()
-        self.data_1d_2d = data_obj[:]
+        # Read data from the file once, then reuse it
+        data = data_obj[:]
+        self.data_1d_2d = data
         if disp_type == "table":
             self.main_plot.set_visibility(False)
             self.main_table.set_visibility(True)
-            rows, columns = util.format_table_from_array(data_obj[:])
+            rows, columns = util.format_table_from_array(data)
             if self.main_table.rows is None:
                 self.main_table._props["rows"] = rows
             else:
@@ -462,19 +832,21 @@ class GuiInteraction(GuiRendering):
             self.main_table.set_visibility(False)
             x, y = None, None
             img = False
-            if len(data_obj.shape) == 2:
-                (height, width) = data_obj.shape
+            if len(data.shape) == 2:
+                (height, width) = data.shape
                 if height == 2:
-                    x, y = np.asarray(data_obj[0]), np.asarray(data_obj[1])
+                    x, y = data[0], data[1]
                 elif width == 2:
-                    x = np.asarray(data_obj[:, 0])
-                    y = np.asarray(data_obj[:, 1])
+                    x, y = data[:, 0], data[:, 1]
                 else:
                     img = True
             else:
-                size = len(data_obj)
-                x, y = np.arange(size), np.asarray(data_obj[:])
+                size = len(data)
+                x, y = np.arange(size), data
             if x is not None:
+                # Keep the envelope of large data, the full data is kept
+                # for saving.
+                x, y = util.decimate_line(x, y, re.MAX_PLOT_POINTS)
                 title = self.hdf_key_display.text.split("/")[-1]
                 fig = self.main_plot.figure
                 fig.clf()
@@ -486,12 +858,17 @@ class GuiInteraction(GuiRendering):
                 fig.tight_layout()
                 self.main_plot.update()
             if img:
+                # Downsample large images to the figure size in pixels,
+                # the same as for slices of 3d data.
+                fig_pixels = int(max(self.fig_size) * self.dpi)
+                step = max(1, max(height, width) // fig_pixels)
                 fig = self.main_plot.figure
                 fig.clf()
                 fig.set_dpi(self.dpi)
                 ax = fig.gca()
-                ax.imshow(data_obj[:], cmap=self.cmap_list.value,
-                          aspect="auto")
+                ax.imshow(data[::step, ::step], cmap=self.cmap_list.value,
+                          aspect="auto",
+                          extent=(-0.5, width - 0.5, height - 0.5, -0.5))
                 fig.tight_layout()
                 self.main_plot.update()
 
@@ -502,21 +879,41 @@ class GuiInteraction(GuiRendering):
         self.zoom_profile_plot.update()
         with self.histogram_plot:
             plt.clf()
-            self.histogram_plot.update()
+        self.info_slice = None
 
-    def show_data(self):
+    async def show_data(self):
         """Display data getting from a hdf file"""
+        # Nothing to do if users haven't interacted with the GUI
+        if not self.state_changed:
+            return
+        # Wait until the slice slider stops, so a drag results in one read
+        if time.monotonic() - self.slice_change_time < re.DEBOUNCE_TIME:
+            return
+        self.state_changed = False
         file_path1 = self.file_path_display.text
         hdf_key1 = self.hdf_key_display.text
         if (file_path1 != "") and (hdf_key1 != "") and (hdf_key1 is not None):
-            new_state = (file_path1, hdf_key1, self.main_slider.value,
-                         self.hdf_value_display.text, self.axis_list.value,
-                         self.cmap_list.value, self.display_type.value,
-                         self.marker_list.value, self.min_slider.value,
-                         self.max_slider.value, self.selected_tab,
-                         self.enable_zoom.value, self.enable_profile.value)
+            disp_type = self.display_type.value
+            # States which need data to be read from the file, and states
+            # which only change how the current slice is displayed.
+            data_state = (file_path1, hdf_key1, self.main_slider.value,
+                          self.axis_list.value, disp_type,
+                          self.marker_list.value)
+            display_state = (self.hdf_value_display.text,
+                             self.cmap_list.value, self.min_slider.value,
+                             self.max_slider.value, self.selected_tab,
+                             self.enable_zoom.value, self.enable_profile.value)
+            new_state = data_state + display_state
             if new_state != self.current_state:
+                only_display = (self.image is not None
+                                and self.current_state is not None
+                                and self.current_state[:len(data_state)]
+                                == data_state)
                 self.current_state = new_state
+                if only_display:
+                    self.enable_ui_elements_3d_data()
+                    self.display_image()
+                    return
                 try:
                     (data_type, value) = util.get_hdf_data(file_path1,
                                                            hdf_key1)
@@ -528,25 +925,24 @@ class GuiInteraction(GuiRendering):
                     elif data_type == "array":
                         self.hdf_value_display.set_text("Array shape: "
                                                         "" + str(value))
-                        hdf_obj = h5py.File(file_path1, "r")
+                        hdf_obj = self.get_hdf_file(file_path1, hdf_key1)
                         dim = len(value)
                         if dim == 3:
-                            self.display_3d_data(hdf_obj[hdf_key1])
+                            await self.display_3d_data(hdf_obj[hdf_key1])
                         elif dim < 3:
-                            self.display_1d_2d_data(
-                                hdf_obj[hdf_key1],
-                                disp_type=self.display_type.value)
+                            self.display_1d_2d_data(hdf_obj[hdf_key1],
+                                                    disp_type=disp_type)
                         else:
                             ui.notify("Can't display {}-d array!".format(dim))
                             self.__clear_plot()
                             self.reset(keep_display=True)
-                        hdf_obj.close()
                     else:
                         self.hdf_value_display.set_text(data_type)
                         self.__clear_plot()
                         self.reset(keep_display=True)
                 except Exception as error:
                     self.reset(keep_display=True)
+                    self.close_hdf_files(file_path1)
                     _, broken_link, msg = util.check_external_link(file_path1,
                                                                    hdf_key1)
                     if broken_link:
@@ -584,9 +980,11 @@ class GuiInteraction(GuiRendering):
             else:
                 check = os.path.isfile(file_path)
                 if file_ext == ".csv":
-                    error = util.save_table(file_path, self.image)
+                    error = await run.io_bound(util.save_table, file_path,
+                                               self.image)
                 else:
-                    error = util.save_image(file_path, self.image)
+                    error = await run.io_bound(util.save_image, file_path,
+                                               self.image)
                 if error is not None:
                     ui.notify(error)
                 else:
@@ -612,7 +1010,8 @@ class GuiInteraction(GuiRendering):
                 ui.notify("Please use .csv as file extension!")
             else:
                 check = os.path.isfile(file_path)
-                error = util.save_table(file_path, self.data_1d_2d)
+                error = await run.io_bound(util.save_table, file_path,
+                                           self.data_1d_2d)
                 if error is not None:
                     ui.notify(error)
                 else:
@@ -626,4 +1025,5 @@ class GuiInteraction(GuiRendering):
     def shutdown(self):
         """Routine to close the app"""
         self.timer.cancel()
+        self.close_hdf_files()
         ui.notify("The server has been stopped. You can close this tab!")
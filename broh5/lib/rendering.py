@@ -6,7 +6,6 @@ Module for constructing GUI components:
 """
 
 import os
-import string
 import platform
 from pathlib import Path
 from typing import Optional, List
@@ -25,6 +24,13 @@ AXIS_LIST = [0, 1, 2]
 FONT_STYLE = "font-size: 105%; font-weight: bold"
 DISPLAY_TYPE = ["plot", "table"]
 UPDATE_RATE = 0.2  # second
+DEBOUNCE_TIME = 0.3  # second, idle time of the slice slider before reading
+CHUNK_CACHE_SIZE = 512 * 1024 * 1024  # byte, chunk cache of an opened hdf file
+CHUNK_CACHE_SLOTS = 100003  # Prime number, number of chunk slots in the cache
+CHUNK_CACHE_W0 = 0.75  # Eviction policy of the chunk cache
+SLICE_CACHE_SIZE = 256 * 1024 * 1024  # byte, recently displayed slices
+MAX_TREE_NODES = 2000  # Nodes of a hdf tree loaded before expanding groups
+MAX_PLOT_POINTS = 10000  # Points of a line plot, larger data is decimated
 RATIO = 0.65  # Ratio for adjusting size between image/plot and screen
 MAX_FIG_SIZE = [12.0, 9.0]
 MAX_PLOT_SIZE = [9.0, 7.0]
@@ -309,6 +315,12 @@ class FilePicker(ui.dialog):
         super().__init__()
         self.show_hidden_files = show_hidden_files
         self.allowed_extensions = allowed_extensions
+        # File-name endings of allowed extensions, for fast checking
+        if allowed_extensions is None:
+            self.extension_suffixes = None
+        else:
+            self.extension_suffixes = tuple('.' + ext.lower()
+                                            for ext in allowed_extensions)
         self.drives_toggle = None
         self.path = Path(directory).expanduser()
         if upper_limit is None:
@@ -329,16 +341,15 @@ class FilePicker(ui.dialog):
 
     def check_extension(self, filename: str) -> bool:
         """Check if the filename has an allowed extension."""
-        if self.allowed_extensions is None:
+        if self.extension_suffixes is None:
             return True
         else:
-            return filename.split('.')[-1].lower() in self.allowed_extensions
+            return filename.lower().endswith(self.extension_suffixes)
 
     def add_drives_toggle(self):
         """Give a list of available drivers in a WinOS computer"""
         if platform.system() == 'Windows':
-            drives = ['%s:\\' % d for d in string.ascii_uppercase if
-                      os.path.exists('%s:' % d)]
+            drives = util.get_windows_drives()
             if self.path != "" or self.path != ".":
                 select_drive = os.path.splitdrive(self.path)[0] + "\\"
             else:
@@ -353,18 +364,15 @@ class FilePicker(ui.dialog):
             self.update_grid()
 
     def update_grid(self) -> None:
-        paths = list(self.path.glob('*'))
-        if not self.show_hidden_files:
-            paths = [p for p in paths if not p.name.startswith('.')]
-        if self.allowed_extensions:
-            paths = [p for p in paths if
-                     p.is_dir() or self.check_extension(p.name)]
-        paths.sort(key=lambda p: p.name.lower())
-        paths.sort(key=lambda p: not p.is_dir())
+        # Filter hidden files and extensions in a single pass
+        entries = [e for e in util.list_folder(self.path)
+                   if (self.show_hidden_files or not e[1].startswith('.'))
+                   and (not e[0] or not self.allowed_extensions
+                        or self.check_extension(e[1]))]
 
         self.grid.options['rowData'] = [
-            {'name': f'📁 <strong>{p.name}</strong>' if p.is_dir() else p.name,
-             'path': str(p), } for p in paths]
+            {'name': name if is_file else f'📁 <strong>{name}</strong>',
+             'path': path, } for (is_file, name, path) in entries]
         if (self.upper_limit is None
                 and self.path != self.path.parent
                 or self.upper_limit is not None
@@ -477,8 +485,7 @@ class FileSaver(ui.dialog):
     def add_drives_toggle(self):
         """Give a list of available drivers in a WinOS computer"""
         if platform.system() == 'Windows':
-            drives = ['%s:\\' % d for d in string.ascii_uppercase if
-                      os.path.exists('%s:' % d)]
+            drives = util.get_windows_drives()
             if self.path != "" or self.path != ".":
                 select_drive = os.path.splitdrive(self.path)[0] + "\\"
             else:
@@ -493,15 +500,13 @@ class FileSaver(ui.dialog):
             self.update_grid()
 
     def update_grid(self) -> None:
-        paths = list(self.path.glob('*'))
+        entries = util.list_folder(self.path)
         if not self.show_hidden_files:
-            paths = [p for p in paths if not p.name.startswith('.')]
-        paths.sort(key=lambda p: p.name.lower())
-        paths.sort(key=lambda p: not p.is_dir())
+            entries = [e for e in entries if not e[1].startswith('.')]
 
         self.grid.options['rowData'] = [
-            {'name': f'📁 <strong>{p.name}</strong>' if p.is_dir() else p.name,
-             'path': str(p)} for p in paths]
+            {'name': name if is_file else f'📁 <strong>{name}</strong>',
+             'path': path} for (is_file, name, path) in entries]
         if (self.upper_limit is None
                 and self.path != self.path.parent
                 or self.upper_limit is not None
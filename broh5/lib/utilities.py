@@ -2,17 +2,30 @@
 Module for utility methods:
 
     -   Get height and with of a screen.
-    -   Convert hdf tree to a nested dictionary.
+    -   Get drives of a WinOS computer, and list entries of a folder.
+    -   Get versions of files, and files linked to a hdf object.
+    -   Convert hdf tree to a nested dictionary, or load a branch of it.
     -   Get data-type and value from a dataset in a hdf file.
+    -   Get size of the chunks read for slicing a 3d dataset.
     -   Convert 1d/2d array to a table format.
+    -   Decimate a line plot, keeping its envelope.
+    -   Rescale a 2d array for saving to an 8-bit image.
+    -   Get histogram of a 2d array.
+    -   Get statistical information of a 2d array.
     -   Save 2d array to an image.
     -   Save 1d/2d array to a csv file.
     -   Save/get path of the last opened folder
 """
 
 import os
+import copy
 import json
+import collections
+import functools
 import platform
+import string
+import time
+import ctypes
 import csv
 import tkinter as tk
 import h5py
@@ -21,9 +34,11 @@ import numpy as np
 from PIL import Image
 
 
+@functools.lru_cache(maxsize=1)
 def get_height_width_screen():
     """
-    Get the height and width of the current screen.
+    Get the height and width of the current screen. The result is cached,
+    so the screen is only queried once.
 
     Returns
     -------
@@ -38,47 +53,285 @@ def get_height_width_screen():
     return screen_height, screen_width, dpi
 
 
-def __recurse(parent_path, name, obj):
+def get_windows_drives():
     """
-    Supplementary function for recursive traversal of HDF5 file structure.
+    Get the available drives of a WinOS computer. The drives are given by
+    a bitmask from GetLogicalDrives, so drives which are slow to respond
+    (network, optical, or removable drives) aren't accessed.
+
+    Returns
+    -------
+    list of str
+        List of drives, e.g. ["C:\\", "D:\\"].
+    """
+    try:
+        mask = ctypes.windll.kernel32.GetLogicalDrives()
+    except (AttributeError, OSError):
+        return ['%s:\\' % d for d in string.ascii_uppercase if
+                os.path.exists('%s:' % d)]
+    return ['%s:\\' % d for i, d in enumerate(string.ascii_uppercase) if
+            mask & (1 << i)]
+
+
+def get_file_version(file_path):
+    """
+    Get the modification time and size of a file, which change when the
+    file is modified. The modification time alone can miss changes made
+    within its resolution on some file systems.
+
+    Parameters
+    ----------
+    file_path : str
+        Path to the file.
+
+    Returns
+    -------
+    tuple
+        Modification time in nanoseconds and size in bytes.
+    """
+    file_stat = os.stat(file_path)
+    return file_stat.st_mtime_ns, file_stat.st_size
+
+
+def get_file_versions(file_paths):
+    """
+    Get the versions of files, as given by get_file_version.
+
+    Parameters
+    ----------
+    file_paths : iterable of str
+        Paths to the files.
+
+    Returns
+    -------
+    tuple
+        Sorted tuple of (path, version) of each file. The version is None
+        if the file doesn't exist.
+    """
+    versions = []
+    for file_path in sorted(set(file_paths)):
+        try:
+            versions.append((file_path, get_file_version(file_path)))
+        except OSError:
+            versions.append((file_path, None))
+    return tuple(versions)
+
+
+def get_linked_files(hdf_obj, hdf_path):
+    """
+    Get the files, other than the opened one, which an object of an HDF5
+    file is read from: targets of external links on its path, and source
+    files of a virtual dataset or of a dataset with external storage.
 
     Parameters
     ----------
-    parent_path : str
-        The path of the parent group.
-    name : str
-        The name of the current group or dataset.
-    obj : h5py-object
-        The current HDF5 group or dataset.
+    hdf_obj : h5py.File
+        Opened HDF5 file.
+    hdf_path : str
+        Path to the object within the HDF5 file.
+
+    Returns
+    -------
+    set of str
+        Paths to the linked files.
+    """
+    file_paths = set()
+    obj = hdf_obj
+    for name in [name for name in hdf_path.split("/") if name]:
+        if not isinstance(obj, h5py.Group):
+            break
+        link = obj.get(name, getlink=True)
+        try:
+            obj = obj[name]
+        except Exception:
+            # Broken external link, its target may be created later
+            if isinstance(link, h5py.ExternalLink):
+                file_paths.add(os.path.join(
+                    os.path.dirname(obj.file.filename), link.filename))
+            break
+        file_paths.add(obj.file.filename)
+    if isinstance(obj, h5py.Dataset):
+        folder = os.path.dirname(obj.file.filename)
+        if obj.is_virtual:
+            for source in obj.virtual_sources():
+                if source.file_name != ".":
+                    file_paths.add(os.path.join(folder, source.file_name))
+        if obj.external:
+            for (file_name, _, _) in obj.external:
+                file_paths.add(os.path.join(folder, file_name))
+    file_paths.discard(hdf_obj.filename)
+    return file_paths
+
+
+def __is_up_to_date(linked_versions):
+    """
+    Supplementary function to check if linked files, given as returned by
+    get_file_versions, haven't been modified.
+    """
+    return get_file_versions(
+        path for (path, _) in linked_versions) == linked_versions
+
+
+@functools.lru_cache(maxsize=32)
+def __list_folder(folder_path, version):
+    """
+    Supplementary function for caching the entries of a folder. The version
+    of the folder is a part of the cache key.
+    """
+    # Entries of os.scandir know their type from the directory listing,
+    # which avoids a stat call per file.
+    try:
+        with os.scandir(folder_path) as dir_entries:
+            entries = [(not e.is_dir(), e.name, e.path) for e in dir_entries]
+    except OSError:
+        return ()
+    # Folders first, then files, sorted by name
+    entries.sort(key=lambda e: (e[0], e[1].lower()))
+    return tuple(entries)
+
+
+def list_folder(folder_path, ttl=2.0):
+    """
+    Get the sorted entries of a folder, folders first. Results are cached
+    until the folder is modified, and for at most ttl seconds, as the
+    modification time of a folder is coarse on some file systems (e.g.
+    FAT/exFAT and network mounts).
+
+    Parameters
+    ----------
+    folder_path : str or Path
+        Path to the folder.
+    ttl : float
+        Maximum age of cached entries, in seconds.
+
+    Returns
+    -------
+    tuple
+        Tuple of (is_file, name, path) of each entry. Empty if the folder
+        can't be read.
+    """
+    try:
+        stat = os.stat(folder_path)
+    except OSError:
+        return ()
+    version = (stat.st_mtime_ns, stat.st_nlink,
+               int(time.monotonic() // ttl))
+    return __list_folder(str(folder_path), version)
+
+
+def __get_external_link_files(group):
+    """
+    Supplementary function to get the target files of the external links in
+    a group. Link types are read in one pass over the links of the group.
+    """
+    names = []
+
+    def check_link(name, info):
+        if info.type == h5py.h5l.TYPE_EXTERNAL:
+            names.append(name.decode("utf-8"))
+
+    group.id.links.iterate(check_link, info=True)
+    folder = os.path.dirname(group.file.filename)
+    return [os.path.join(folder, group.get(name, getlink=True).filename)
+            for name in names]
+
+
+def __walk_group(group, group_path, max_nodes=None, linked_files=None):
+    """
+    Supplementary function for breadth-first traversal of HDF5 file
+    structure.
+
+    Parameters
+    ----------
+    group : h5py-object
+        The HDF5 group to traverse.
+    group_path : str
+        The path of the group, "" for the root.
+    max_nodes : int, optional
+        Approximate maximum number of nodes to walk. Children of groups
+        which are not walked are replaced by a placeholder node, its key is
+        the group path followed by "/". Walk the whole structure if None.
+    linked_files : set, optional
+        Set to which the files reached through external links are added.
 
     Returns
     -------
     list
-        A list of dictionaries describing the HDF5 groups and datasets.
+        A list of dictionaries describing the HDF5 groups and datasets
+        inside the group.
     """
-    current_path = f"{parent_path}/{name}" if parent_path else name
-    if isinstance(obj, h5py._hl.dataset.Dataset):
-        return [{"id": name, "label": current_path}]
-    elif isinstance(obj, h5py._hl.group.Group):
-        children = []
+    nodes = []
+    queue = collections.deque([(group, None, group_path, nodes)])
+    num_nodes = 0
+    while queue:
+        (parent, key, path, children) = queue.popleft()
+        if max_nodes is not None and num_nodes >= max_nodes:
+            children.append({"id": "...", "label": f"{path}/"})
+            continue
+        # Groups are only opened when they are walked
+        obj = parent if key is None else parent[key]
+        if linked_files is not None:
+            linked_files.add(obj.file.filename)
+            linked_files.update(__get_external_link_files(obj))
         for key in obj.keys():
+            current_path = f"{path}/{key}" if path else key
+            node = {"id": key, "label": current_path}
             try:
-                child_obj = obj[key]
-                child_items = __recurse(current_path, key, child_obj)
-                children.extend(child_items)
+                # Get the type from the object header without opening it
+                if obj.get(key, getclass=True) is h5py.Group:
+                    node["children"] = []
+                    queue.append((obj, key, current_path, node["children"]))
             except Exception:
-                children.append({"id": key, "label": f"{current_path}/{key}"})
-        return [{"id": name, "label": current_path, "children": children}]
+                # Broken link, keep the label given by earlier versions
+                node["label"] = f"{path}/{key}"
+            children.append(node)
+            num_nodes += 1
+    return nodes
+
+
+@functools.lru_cache(maxsize=16)
+def __get_hdf_tree(hdf_file, group_path, max_nodes, version):
+    """
+    Supplementary function for caching the tree structure of an HDF5 file.
+    The version (modification time and size) of the file is a part of the
+    cache key. The versions of the files reached through external links are
+    returned with the tree, to be checked when it is reused.
+    """
+    with h5py.File(hdf_file, 'r') as hdf_obj1:
+        group = hdf_obj1[group_path] if group_path else hdf_obj1
+        linked_files = get_linked_files(hdf_obj1, group_path)
+        nodes = __walk_group(group, group_path, max_nodes, linked_files)
+        linked_files.discard(hdf_obj1.filename)
+        return nodes, get_file_versions(linked_files)
 
 
-def hdf_tree_to_dict(hdf_file):
+def __get_tree(hdf_file, group_path, max_nodes):
     """
-    Convert an HDF5 file structure to a nested dictionary.
+    Supplementary function for getting the cached tree structure of an HDF5
+    file, walked again if a linked file has been modified.
+    """
+    version = get_file_version(hdf_file)
+    (nodes, linked_versions) = __get_hdf_tree(hdf_file, group_path,
+                                              max_nodes, version)
+    if not __is_up_to_date(linked_versions):
+        (nodes, _) = __get_hdf_tree.__wrapped__(hdf_file, group_path,
+                                                max_nodes, version)
+    return copy.deepcopy(nodes)
+
+
+def hdf_tree_to_dict(hdf_file, max_nodes=None):
+    """
+    Convert an HDF5 file structure to a nested dictionary. Results are
+    cached until the file, or a file reached through its external links, is
+    modified.
 
     Parameters
     ----------
     hdf_file : str
         Path to the HDF5 file.
+    max_nodes : int, optional
+        Maximum number of nodes to walk, the remaining groups can be loaded
+        using get_hdf_tree_branch. Walk the whole structure if None.
 
     Returns
     -------
@@ -87,20 +340,112 @@ def hdf_tree_to_dict(hdf_file):
         or a string describing an error if one occurs.
     """
     try:
-        hdf_obj1 = h5py.File(hdf_file, 'r')
-        result = __recurse("", "", hdf_obj1)
-        file_name = os.path.basename(hdf_file)
-        result[0]['id'] = file_name
-        result[0]['label'] = "/"
-        hdf_obj1.close()
-        return result
+        children = __get_tree(hdf_file, "", max_nodes)
+        return [{"id": os.path.basename(hdf_file), "label": "/",
+                 "children": children}]
+    except Exception as error:
+        return str(error)
+
+
+def get_hdf_tree_branch(hdf_file, group_path, max_nodes=None):
+    """
+    Get the structure inside a group of an HDF5 file, as used by
+    hdf_tree_to_dict.
+
+    Parameters
+    ----------
+    hdf_file : str
+        Path to the HDF5 file.
+    group_path : str
+        Path to the group within the HDF5 file.
+    max_nodes : int, optional
+        Maximum number of nodes to walk. Walk the whole structure if None.
+
+    Returns
+    -------
+    list or str
+        A list of dictionaries describing the groups and datasets inside
+        the group, or a string describing an error if one occurs.
+    """
+    try:
+        return __get_tree(hdf_file, group_path, max_nodes)
     except Exception as error:
         return str(error)
 
 
+@functools.lru_cache(maxsize=256)
+def __get_hdf_data(file_path, dataset_path, version):
+    """
+    Supplementary function for caching the data type and value of a dataset.
+    The version (modification time and size) of the file is a part of the
+    cache key. The versions of the files the dataset is read from through
+    external links or virtual sources are returned with the result, to be
+    checked when it is reused.
+    """
+    with h5py.File(file_path, 'r') as file:
+        linked_versions = get_file_versions(get_linked_files(file,
+                                                             dataset_path))
+        return __read_hdf_data(file, dataset_path) + (linked_versions,)
+
+
+def __read_hdf_data(file, dataset_path):
+    """
+    Supplementary function for reading the data type and value of a dataset
+    from an opened HDF5 file.
+    """
+    if dataset_path not in file:
+        return "not path", None
+    item = file[dataset_path]
+    if isinstance(item, h5py.Group):
+        return "group", None
+    data_type, value = "unknown", None
+    # Check the type and shape of a dataset
+    if item.dtype.kind == 'S':  # Fixed-length bytes
+        data = item[()]
+        if item.size == 1:  # Single string or byte
+            if isinstance(data, bytes):
+                data_type, value = "string", data.decode('utf-8')
+            elif isinstance(data.flat[0], bytes):
+                data_type, value = "string", data.flat[0].decode(
+                    'utf-8')
+        else:
+            data_type, value = "array", [d.decode('utf-8') for d in
+                                         data]
+    elif item.dtype.kind == 'U':  # Fixed-length Unicode
+        data = item[()]
+        if item.size == 1:  # Single string
+            data_type, value = "string", data
+        else:
+            data_type, value = "array", list(data)
+    elif h5py.check_dtype(vlen=item.dtype) in [str, bytes]:
+        data = item[()]
+        if isinstance(data, (str, bytes)):
+            data_type, value = "string", data if isinstance(data, str)\
+                else data.decode('utf-8')
+        else:
+            try:
+                # Join the bytes first, then decode them in one call
+                joined_data = b''.join(data).decode('utf-8')
+            except TypeError:
+                joined_data = ''.join(
+                    [d if isinstance(d, str) else d.decode('utf-8')
+                     for d in data])
+            data_type, value = "string", joined_data
+    elif item.dtype.kind in ['i', 'f', 'u']:
+        if item.shape == () or item.size == 1:
+            data_type, value = "number", item[()]
+        else:
+            data_type, value = "array", item.shape
+    elif item.dtype.kind == 'b':  # Boolean type
+        data_type, value = "boolean", int(item[()])
+    return data_type, value
+
+
 def get_hdf_data(file_path, dataset_path):
     """
     Get data type and value from a specified dataset in an HDF5 file.
+    Results are cached until the file, or a file the dataset is read from
+    through external links or virtual sources, is modified.
 
     Parameters
     ----------
@@ -114,52 +459,42 @@ def get_hdf_data(file_path, dataset_path):
     tuple
         A tuple containing the data type and the value of the dataset.
     """
-    with h5py.File(file_path, 'r') as file:
-        if dataset_path not in file:
-            return "not path", None
-        try:
-            item = file[dataset_path]
-            if isinstance(item, h5py.Group):
-                return "group", None
-            data_type, value = "unknown", None
-            # Check the type and shape of a dataset
-            if item.dtype.kind == 'S':  # Fixed-length bytes
-                data = item[()]
-                if item.size == 1:  # Single string or byte
-                    if isinstance(data, bytes):
-                        data_type, value = "string", data.decode('utf-8')
-                    elif isinstance(data.flat[0], bytes):
-                        data_type, value = "string", data.flat[0].decode(
-                            'utf-8')
-                else:
-                    data_type, value = "array", [d.decode('utf-8') for d in
-                                                 data]
-            elif item.dtype.kind == 'U':  # Fixed-length Unicode
-                data = item[()]
-                if item.size == 1:  # Single string
-                    data_type, value = "string", data
-                else:
-                    data_type, value = "array", list(data)
-            elif h5py.check_dtype(vlen=item.dtype) in [str, bytes]:
-                data = item[()]
-                if isinstance(data, (str, bytes)):
-                    data_type, value = "string", data if isinstance(data, str)\
-                        else data.decode('utf-8')
-                else:
-                    joined_data = ''.join(
-                        [d if isinstance(d, str) else d.decode('utf-8')
-                         for d in data])
-                    data_type, value = "string", joined_data
-            elif item.dtype.kind in ['i', 'f', 'u']:
-                if item.shape == () or item.size == 1:
-                    data_type, value = "number", item[()]
-                else:
-                    data_type, value = "array", item.shape
-            elif item.dtype.kind == 'b':  # Boolean type
-                data_type, value = "boolean", int(item[()])
-            return data_type, value
-        except Exception as error:
-            return str(error), None
+    version = get_file_version(file_path)
+    try:
+        (data_type, value, linked_versions) = __get_hdf_data(
+            file_path, dataset_path, version)
+        if not __is_up_to_date(linked_versions):
+            (data_type, value, _) = __get_hdf_data.__wrapped__(
+                file_path, dataset_path, version)
+        return data_type, value
+    except Exception as error:
+        return str(error), None
+
+
+def get_chunk_read_size(data_obj, axis):
+    """
+    Get the size of the chunks which must be read to get one slice of a 3D
+    chunked HDF5 dataset along a given axis.
+
+    Parameters
+    ----------
+    data_obj : h5py.Dataset
+        3D dataset.
+    axis : int
+        Slicing axis.
+
+    Returns
+    -------
+    int or None
+        Number of bytes, or None if the dataset is not chunked.
+    """
+    if data_obj.chunks is None:
+        return None
+    num_chunks = 1
+    for i, (size, c_size) in enumerate(zip(data_obj.shape, data_obj.chunks)):
+        if i != axis:
+            num_chunks *= -(-size // c_size)
+    return num_chunks * int(np.prod(data_obj.chunks)) * data_obj.dtype.itemsize
 
 
 def check_external_link(file_path, dataset_path):
@@ -269,21 +604,104 @@ def format_table_from_array(data):
     if height > 1000 and width > 1000:
         rows, columns = None, None
     else:
-        fm_data = np.insert(data, 0, np.arange(height), axis=1)
         columns = [{"name": "Column " + str(j), "label": "Column " + str(j),
                     "field": "Column " + str(j)} for j in range(width)]
         columns.insert(0,
                        {"name": "Index", "label": "Index", "field": "Index"})
-        rows = []
-        for i in range(height):
-            dict_tmp = {}
-            for j in range(width + 1):
-                dict_tmp[columns[j]["name"]] = fm_data[i][j]
-            rows.append(dict_tmp)
+        names = [column["name"] for column in columns]
+        # Prepend the index to each row without copying the array, which
+        # would also cast the index to the data type (e.g. uint8, bool).
+        rows = [dict(zip(names, (i, *row))) for i, row in enumerate(data)]
     return rows, columns
 
 
-def format_statistical_info(image):
+def decimate_line(x, y, max_points=10000):
+    """
+    Reduce the number of points of a line plot by keeping, in each group of
+    consecutive points, the points having the minimum and maximum values.
+    The first and last points are always kept. This preserves the envelope
+    and the x-range of the line.
+
+    Parameters
+    ----------
+    x : array_like
+        1D array, x-values of the points.
+    y : array_like
+        1D array, y-values of the points.
+    max_points : int
+        Maximum number of points to keep, at least 4.
+
+    Returns
+    -------
+    x : ndarray
+        x-values of the kept points.
+    y : ndarray
+        y-values of the kept points.
+    """
+    x, y = np.asarray(x), np.asarray(y)
+    size = len(y)
+    max_points = max(4, max_points)
+    if size <= max_points:
+        return x, y
+    # Points between the first and the last one, in groups of two kept
+    # points each, the last group can be shorter.
+    inner = size - 2
+    group = -(-inner // ((max_points - 2) // 2))
+    num_group = inner // group
+    end = 1 + num_group * group
+    offsets = 1 + np.arange(num_group) * group
+    groups = y[1:end].reshape(num_group, group)
+    list_idx = [[0, size - 1], offsets + np.argmin(groups, axis=1),
+                offsets + np.argmax(groups, axis=1)]
+    if end < size - 1:
+        list_idx.append([end + np.argmin(y[end:-1]),
+                         end + np.argmax(y[end:-1])])
+    indices = np.unique(np.concatenate(list_idx))
+    return x[indices], y[indices]
+
+
+def get_statistics(mat, block_size=2 ** 18):
+    """
+    Get the minimum, maximum, mean, and standard deviation of an array.
+    The array is processed in blocks small enough to stay in the CPU cache,
+    so the minimum, maximum, and sum are computed in one pass over memory
+    while each block is in cache, and the standard deviation in a second
+    pass, without temporary arrays of the array size.
+
+    Parameters
+    ----------
+    mat : ndarray
+        Input array.
+    block_size : int
+        Approximate number of elements in a block.
+
+    Returns
+    -------
+    tuple
+        Minimum, maximum, mean, and standard deviation.
+    """
+    mat = np.asarray(mat)
+    if mat.ndim < 2:
+        mat = mat.reshape(1, -1)
+    step = max(1, block_size // max(1, mat[0].size))
+    blocks = [mat[i:i + step] for i in range(0, len(mat), step)]
+    list_min, list_max, total = [], [], 0.0
+    for block in blocks:
+        list_min.append(np.min(block))
+        list_max.append(np.max(block))
+        total += np.sum(block, dtype=np.float64)
+    # NumPy reductions, so a NaN in any block gives NaN as for np.min
+    min_val, max_val = np.min(list_min), np.max(list_max)
+    mean_val = total / mat.size
+    sum_sq = 0.0
+    for block in blocks:
+        dev = np.subtract(block, mean_val, dtype=np.float64).ravel()
+        sum_sq += np.dot(dev, dev)
+    std_val = np.sqrt(sum_sq / mat.size)
+    return min_val, max_val, mean_val, std_val
+
+
+def format_statistical_info(image, stats=None):
     """
     Get statistical information of a 2d array and format the output as a
     Nicegui table object.
@@ -292,6 +710,9 @@ def format_statistical_info(image):
     ----------
     image : ndarray
         NumPy array to format.
+    stats : tuple, optional
+        Minimum, maximum, mean, and standard deviation of the array, as
+        returned by get_statistics. Computed if None.
 
     Returns
     -------
@@ -299,10 +720,9 @@ def format_statistical_info(image):
         A tuple containing the rows and columns formatted for the table.
     """
     data_type = image.dtype.name
-    min_val = np.min(image)
-    max_val = np.max(image)
-    mean_val = np.mean(image)
-    std_val = np.std(image)
+    if stats is None:
+        stats = get_statistics(image)
+    (min_val, max_val, mean_val, std_val) = stats
     columns = [{"name": "information", "label": "Information",
                 "field": "information"},
                {"name": "value", "label": "Value", "field": "value"}]
@@ -314,6 +734,99 @@ def format_statistical_info(image):
     return rows, columns
 
 
+def rescale_image(mat):
+    """
+    Rescale a 2D array to an 8-bit array using the range of its values. The
+    array is processed in blocks of rows using in-place operations on a
+    small float64 buffer, so no temporary array of the image size is
+    allocated.
+
+    Parameters
+    ----------
+    mat : ndarray
+        2D array.
+
+    Returns
+    -------
+    ndarray
+        8-bit array.
+    """
+    nmin, nmax = np.min(mat), np.max(mat)
+    out = np.zeros(mat.shape, dtype=np.uint8)
+    if nmax == nmin:
+        return out
+    # Subtract in float64 to avoid overflow of small integer types and loss
+    # of precision of values with a large offset.
+    scale = 255.0 / (np.float64(nmax) - np.float64(nmin))
+    step = max(1, 2 ** 16 // max(1, mat.shape[-1]))
+    for i in range(0, mat.shape[0], step):
+        buffer = np.subtract(mat[i:i + step], nmin, dtype=np.float64)
+        np.multiply(buffer, scale, out=buffer)
+        out[i:i + step] = buffer
+    return out
+
+
+def get_histogram(mat, num_bins=255, nmin=None, nmax=None):
+    """
+    Get the histogram of an array using equal-width bins. Values are
+    converted to bin indices and counted using np.bincount, which is
+    faster than np.histogram. Integer arrays with a small range of values
+    are counted per value first, avoiding a float pass over the array.
+
+    Parameters
+    ----------
+    mat : ndarray
+        Input array.
+    num_bins : int
+        Number of bins.
+    nmin : float, optional
+        Minimum of the array, computed if None.
+    nmax : float, optional
+        Maximum of the array, computed if None.
+
+    Returns
+    -------
+    hist : ndarray
+        Number of values in each bin.
+    bin_edges : ndarray
+        Edges of the bins, size of num_bins + 1.
+    """
+    if nmin is None:
+        nmin = np.min(mat)
+    if nmax is None:
+        nmax = np.max(mat)
+    if mat.dtype.kind in "ui" and mat.dtype.itemsize < 8:
+        # Avoid overflow of the integer type when subtracting
+        nmin, nmax = np.int64(nmin), np.int64(nmax)
+    if (mat.dtype.kind in "ui" and nmin < nmax
+            and nmax - nmin < min(2 ** 16, mat.size)):
+        # Integer data with a small range: count each value once, then
+        # group the counts into bins.
+        if mat.dtype.kind == "u" and nmax < 2 ** 16:
+            counts = np.bincount(mat.ravel())[nmin:]
+        else:
+            counts = np.bincount(np.subtract(mat.ravel(), nmin,
+                                             dtype=np.intp))
+        mat = np.arange(nmin, nmax + 1)
+    else:
+        counts = None
+        if nmax == nmin:
+            nmin, nmax = nmin - 0.5, nmax + 0.5
+    bin_edges = np.linspace(nmin, nmax, num_bins + 1)
+    # Subtract in float64, float32 loses the precision of values with a
+    # large offset.
+    index = np.subtract(mat, nmin, dtype=np.float64)
+    np.multiply(index, num_bins / (nmax - nmin), out=index)
+    index = index.astype(np.intp).ravel()
+    np.minimum(index, num_bins - 1, out=index)
+    if counts is None:
+        hist = np.bincount(index, minlength=num_bins)
+    else:
+        hist = np.bincount(index, weights=counts,
+                           minlength=num_bins).astype(np.int64)
+    return hist, bin_edges
+
+
 def save_image(file_path, mat):
     """
     Save a 2D array as an image file.
@@ -332,8 +845,7 @@ def save_image(file_path, mat):
     """
     file_ext = os.path.splitext(file_path)[-1]
     if not ((file_ext == ".tif") or (file_ext == ".tiff")):
-        mat = np.uint8(
-            255.0 * (mat - np.min(mat)) / (np.max(mat) - np.min(mat)))
+        mat = rescale_image(mat)
     else:
         if mat.dtype != np.float32:
             mat = mat.astype(np.float32)
@@ -445,10 +957,11 @@ def get_image_roi(x, y, mat, zoom=2):
     """
     (height, width) = mat.shape
     min_size = min(height, width)
-    rad = np.clip(int(0.5 * min_size // zoom), 1, min_size // 2 - 1)
+    # Clip scalars with min/max, as np.clip is slow for single values
+    rad = min(max(int(0.5 * min_size // zoom), 1), min_size // 2 - 1)
     size = 2 * rad
-    x_start = np.clip(x - rad, 0, width - size)
-    y_start = np.clip(y - rad, 0, height - size)
+    x_start = min(max(x - rad, 0), width - size)
+    y_start = min(max(y - rad, 0), height - size)
     x_stop = x_start + size
     y_stop = y_start + size
     roi = mat[y_start:y_stop, x_start:x_stop]
@@ -3,8 +3,6 @@ import sys
 import signal
 import socket
 import argparse
-from nicegui import ui, app
-from broh5.lib.interactions import GuiInteraction
 from broh5 import __version__
 
 display_msg = """
@@ -78,6 +76,9 @@ def parse_args():
     parser.add_argument("--port", type=int, default=8180,
                         help="Specify the port to run broh5 on "
                              "(default: 8180)")
+    parser.add_argument("--cache", type=int, default=512,
+                        help="Chunk cache size in MB for each opened hdf "
+                             "file (default: 512)")
     args = parser.parse_args()
     return args
 
@@ -92,6 +93,12 @@ def main():
               "different port using --port !!!\n".format(args.port))
         sys.exit(1)
     signal.signal(signal.SIGINT, signal_handler)  # Back-up shutdown
+    # Import GUI modules (NiceGUI, matplotlib, h5py, ...) only when needed,
+    # so parsing arguments or checking the port doesn't pay their cost.
+    from nicegui import ui, app
+    import broh5.lib.rendering as re
+    from broh5.lib.interactions import GuiInteraction
+    re.CHUNK_CACHE_SIZE = max(args.cache, 0) * 1024 * 1024
     try:
         broh5_app = GuiInteraction()
         os.environ["NO_NETIFACES"] = "True"
@@ -15,6 +15,7 @@
 
 import sys
 import os
+import glob
 sys.path.insert(0, os.path.abspath('../..'))
 
 # -- General configuration ------------------------------------------------
@@ -23,7 +24,6 @@ sys.path.insert(0, os.path.abspath('../..'))
 # extensions coming with Sphinx (named 'sphinx.ext.*') or your custom
 # ones.
 extensions = [
-    'nbsphinx',
     'sphinx.ext.autodoc',
     'sphinx.ext.mathjax',
     'sphinx.ext.todo',
@@ -31,6 +31,10 @@ extensions = [
     'sphinx.ext.napoleon',
     'sphinx.ext.viewcode'
 ]
+# Only load nbsphinx (and its nbconvert/jupyter imports) if there are
+# notebooks to build.
+if glob.glob('**/*.ipynb', recursive=True):
+    extensions.insert(0, 'nbsphinx')
 # extensions = ['autoapi.extension']
 
 # Napoleon settings
@@ -119,11 +123,9 @@ autodoc_mock_imports = [
     'matplotlib',
     'nicegui',
     'PIL',
-    'hdf5plugin',
-
 ]
 
-# autoapi_dirs = ['../..']
+# autoapi_dirs = ['../../broh5']
 
 autodoc_member_order = 'bysource'
 numfig = True
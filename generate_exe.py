@@ -11,7 +11,8 @@ cmd = [
     '-m', 'PyInstaller',
     './broh5/main.py',
     '--name', 'broh5',
-    '--onefile',
+    '--onedir',
+    '--noupx',
     '--hidden-import=matplotlib.backends.backend_svg',
     '--add-data', f'{Path(nicegui.__file__).parent}{os.pathsep}nicegui'
 ]
@@ -4,10 +4,10 @@ import setuptools
 dependencies = [
     "numpy>1.21",
     "h5py>3.7",
-    "hdf5plugin",
+    "hdf5plugin>=4.0",
     "pillow",
     "matplotlib",
-    "nicegui>=1.4.21"
+    "nicegui>=1.4.21,<4"
 ]
 
 HERE = pathlib.Path(__file__).parent
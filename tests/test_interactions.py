@@ -0,0 +1,120 @@
+import io
+import os
+import re
+import shutil
+import subprocess
+import sys
+import tempfile
+import unittest
+from unittest import mock
+import h5py
+import numpy as np
+from matplotlib.figure import Figure
+import broh5.lib.utilities as util
+from broh5.lib.interactions import GuiInteraction
+
+
+class MockPlot:
+    """Stand-in for ui.matplotlib, rendering the figure to SVG on update"""
+
+    def __init__(self, figure):
+        self.figure = figure
+        self._props = {}
+
+    def update(self):
+        output = io.StringIO()
+        self.figure.savefig(output, format="svg")
+        self._props["innerHTML"] = output.getvalue()
+
+
+class MockValue:
+
+    def __init__(self, value):
+        self.value = value
+
+
+class InteractionsMethods(unittest.TestCase):
+
+    def setUp(self):
+        self.fig_size, self.dpi = (8.0, 6.0), 80
+
+    def draw_image(self, image):
+        # GuiInteraction without its GUI, only what drawing an image needs
+        gui = GuiInteraction.__new__(GuiInteraction)
+        gui.main_plot = MockPlot(Figure(figsize=self.fig_size, dpi=self.dpi))
+        gui.fig = gui.main_plot.figure
+        gui.fig_size, gui.dpi = self.fig_size, self.dpi
+        gui.image = image
+        gui.current_slice, gui.image_ranges = (0, 0, "file", "key"), {}
+        gui.image_artist, gui.ax = None, None
+        gui.main_svg, gui.overlay = None, None
+        gui.cmap_list = MockValue("gray")
+        gui._GuiInteraction__draw_image(0, 255)
+        return gui
+
+    def test_to_svg_xy(self):
+        pattern = r'<g id="ref_line">\s*<path d="M ([-\d.]+) ([-\d.]+)\s*' \
+                  r'L ([-\d.]+) ([-\d.]+)'
+        for (height, width) in [(300, 300), (400, 200), (200, 400)]:
+            image = np.random.rand(height, width).astype(np.float32)
+            gui = self.draw_image(image)
+            (x0, y0, x1, y1) = (-0.5, height / 3, width - 0.5, height / 3)
+            gui.ax.set_autoscale_on(False)
+            gui.ax.plot([x0, x1], [y0, y1], gid="ref_line")
+            gui.main_plot.update()
+            match = re.search(pattern, gui.main_plot._props["innerHTML"])
+            mpl_xy = [float(val) for val in match.groups()]
+            svg_xy = (list(gui._GuiInteraction__to_svg_xy(x0, y0))
+                      + list(gui._GuiInteraction__to_svg_xy(x1, y1)))
+            self.assertTrue(np.allclose(svg_xy, mpl_xy, atol=1e-3),
+                            msg=f"Image shape: {(height, width)}")
+
+    def test_update_svg_image(self):
+        header = "data:image/png;base64,"
+        image = np.random.rand(200, 300).astype(np.float32)
+        gui = self.draw_image(image)
+        svg = gui.main_svg
+        # Same layout, only the embedded image is replaced
+        gui.image = 1.0 - image
+        with mock.patch.object(GuiInteraction,
+                               "_GuiInteraction__set_main_svg") as set_svg:
+            gui._GuiInteraction__draw_image(0, 255)
+            set_svg.assert_called_once_with(gui.main_svg)
+        self.assertNotEqual(gui.main_svg, svg)
+        self.assertEqual(gui.main_svg.split(header)[0], svg.split(header)[0])
+        # No inline image in the SVG, the whole figure is rendered
+        gui.main_svg = "<svg></svg>"
+        gui.image = image
+        gui._GuiInteraction__draw_image(0, 255)
+        self.assertIn(header, gui.main_svg)
+
+    def test_get_hdf_file(self):
+        tmp_folder = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, tmp_folder)
+        ext_path = os.path.join(tmp_folder, "external.hdf")
+        file_path = os.path.join(tmp_folder, "master.hdf")
+        with h5py.File(ext_path, "w") as hdf_obj:
+            hdf_obj["value"] = 1.5
+        with h5py.File(file_path, "w") as hdf_obj:
+            hdf_obj["value"] = h5py.ExternalLink("external.hdf", "/value")
+        gui = GuiInteraction.__new__(GuiInteraction)
+        gui.hdf_files, gui.data_shapes = {}, {}
+        gui.slice_cache, gui.image_ranges = {}, {}
+        hdf_obj = gui.get_hdf_file(file_path, "value")
+        self.assertEqual(hdf_obj["value"][()], 1.5)
+        self.assertIs(gui.get_hdf_file(file_path, "value"), hdf_obj)
+        # Other processes can write to the file while it is kept open
+        code = f"import h5py; h5py.File({file_path!r}, 'a').attrs['a'] = 1"
+        self.assertEqual(subprocess.run([sys.executable, "-c", code]
+                                        ).returncode, 0)
+        # Accept the master file as modified, to check linked files alone
+        gui.hdf_files[file_path] = (hdf_obj, util.get_file_version(file_path),
+                                    gui.hdf_files[file_path][2])
+        # The file is opened again if a linked file is modified
+        with h5py.File(ext_path, "w") as hdf_obj1:
+            hdf_obj1["value"] = 2.5
+            hdf_obj1["other"] = np.zeros(8)
+        hdf_obj1 = gui.get_hdf_file(file_path, "value")
+        self.assertIsNot(hdf_obj1, hdf_obj)
+        self.assertEqual(hdf_obj1["value"][()], 2.5)
+        gui.close_hdf_files()
@@ -0,0 +1,225 @@
+import os
+import shutil
+import tempfile
+import unittest
+from unittest import mock
+import h5py
+import numpy as np
+from PIL import Image
+import broh5.lib.utilities as util
+
+
+class UtilityMethods(unittest.TestCase):
+
+    def setUp(self):
+        rng = np.random.default_rng(1)
+        self.float_mat = 1.0e6 + rng.random((200, 300))
+        self.int_mat = 2 ** 40 + rng.integers(0, 10 ** 6, (200, 300))
+        self.uint_mat = rng.integers(0, 4000, (200, 300)).astype(np.uint16)
+        self.tmp_folder = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp_folder)
+
+    def test_get_histogram(self):
+        for mat in [self.float_mat, self.int_mat, self.uint_mat]:
+            hist, bin_edges = util.get_histogram(mat, 255)
+            hist1, bin_edges1 = np.histogram(mat, 255)
+            self.assertTrue(np.array_equal(hist, hist1),
+                            msg=f"Data type: {mat.dtype}")
+            self.assertTrue(np.allclose(bin_edges, bin_edges1))
+
+    def test_save_image(self):
+        file_path = os.path.join(self.tmp_folder, "image.png")
+        for mat in [self.float_mat, self.int_mat, self.uint_mat]:
+            self.assertIsNone(util.save_image(file_path, mat))
+            nmin, nmax = np.min(mat), np.max(mat)
+            mat1 = np.uint8(255.0 * (np.float64(mat) - nmin) / (nmax - nmin))
+            mat2 = np.asarray(Image.open(file_path))
+            self.assertTrue(np.array_equal(mat1, mat2),
+                            msg=f"Data type: {mat.dtype}")
+
+    def test_hdf_tree_to_dict(self):
+        file_path = os.path.join(self.tmp_folder, "data.hdf")
+        with h5py.File(file_path, "w") as hdf_obj:
+            group = hdf_obj.create_group("entry")
+            group.create_dataset("data", data=np.zeros(3))
+            group["broken"] = h5py.SoftLink("/missing")
+            hdf_obj["broken"] = h5py.SoftLink("/missing")
+            hdf_obj["external"] = h5py.ExternalLink("missing.hdf", "/data")
+        children = util.hdf_tree_to_dict(file_path)[0]["children"]
+        self.assertEqual(children, [
+            {"id": "broken", "label": "/broken"},
+            {"id": "entry", "label": "entry", "children": [
+                {"id": "broken", "label": "entry/broken"},
+                {"id": "data", "label": "entry/data"}]},
+            {"id": "external", "label": "/external"}])
+
+    def test_external_link_modified(self):
+        ext_path = os.path.join(self.tmp_folder, "external.hdf")
+        file_path = os.path.join(self.tmp_folder, "master.hdf")
+
+        def write_external(value, num_datasets):
+            with h5py.File(ext_path, "w") as hdf_obj:
+                hdf_obj["value"] = value
+                group = hdf_obj.create_group("group")
+                for i in range(num_datasets):
+                    group[f"data{i}"] = i
+
+        write_external(1.5, 1)
+        with h5py.File(file_path, "w") as hdf_obj:
+            hdf_obj["entry/value"] = h5py.ExternalLink("external.hdf",
+                                                       "/value")
+            hdf_obj["entry/group"] = h5py.ExternalLink("external.hdf",
+                                                       "/group")
+            layout = h5py.VirtualLayout((1,), "f8")
+            layout[0] = h5py.VirtualSource("external.hdf", "value",
+                                           shape=())
+            hdf_obj.create_virtual_dataset("virtual", layout)
+        self.assertEqual(util.get_hdf_data(file_path, "entry/value"),
+                         ("number", 1.5))
+        self.assertEqual(util.get_hdf_data(file_path, "virtual")[1], 1.5)
+        branch = util.get_hdf_tree_branch(file_path, "entry/group")
+        self.assertEqual(len(branch), 1)
+        # Rewrite the external file only, the master file is unchanged
+        version = util.get_file_version(file_path)
+        write_external(2.5, 3)
+        self.assertEqual(util.get_file_version(file_path), version)
+        self.assertEqual(util.get_hdf_data(file_path, "entry/value"),
+                         ("number", 2.5))
+        self.assertEqual(util.get_hdf_data(file_path, "virtual")[1], 2.5)
+        branch = util.get_hdf_tree_branch(file_path, "entry/group")
+        self.assertEqual(len(branch), 3)
+        tree = util.hdf_tree_to_dict(file_path)[0]["children"]
+        self.assertEqual(len(tree[0]["children"][0]["children"]), 3)
+
+    def test_get_statistics(self):
+        nan_first = np.arange(1.0, 17.0, dtype=np.float32).reshape(4, 4)
+        nan_last = nan_first.copy()
+        nan_first[0, 0] = np.nan
+        nan_last[-1, -1] = np.nan
+        for mat in [self.float_mat, self.int_mat, self.uint_mat,
+                    nan_first, nan_last]:
+            # Small blocks, so the array is processed in several blocks
+            stats = util.get_statistics(mat, block_size=mat.shape[-1])
+            stats1 = (np.min(mat), np.max(mat), np.mean(mat, dtype=np.float64),
+                      np.std(mat, dtype=np.float64))
+            self.assertTrue(np.allclose(stats, stats1, rtol=1e-10,
+                                        equal_nan=True),
+                            msg=f"Statistics: {stats} != {stats1}")
+
+    def test_decimate_line(self):
+        rng = np.random.default_rng(2)
+        for (size, max_points) in [(100001, 1000), (20001, 10000),
+                                   (1000, 7), (500, 1000)]:
+            x = np.arange(size)
+            y = rng.normal(size=size)
+            (x1, y1) = util.decimate_line(x, y, max_points)
+            self.assertLessEqual(len(x1), max(max_points, 4))
+            self.assertEqual((x1[0], x1[-1]), (x[0], x[-1]))
+            self.assertEqual((np.min(y1), np.max(y1)), (np.min(y), np.max(y)))
+            self.assertTrue(np.array_equal(y1, y[x1]))
+
+    def test_list_folder(self):
+        folder = os.path.join(self.tmp_folder, "folder")
+        os.mkdir(folder)
+        open(os.path.join(folder, "b.txt"), "w").close()
+        os.mkdir(os.path.join(folder, "A"))
+
+        def reference():
+            with os.scandir(folder) as entries:
+                return sorted(((not e.is_dir(), e.name, e.path)
+                               for e in entries),
+                              key=lambda e: (e[0], e[1].lower()))
+
+        with mock.patch.object(util.time, "monotonic", return_value=10.0):
+            self.assertEqual(list(util.list_folder(folder)), reference())
+            # New sub-folder, with the modification time of the folder
+            # unchanged as on file systems with a coarse time resolution
+            mtime = os.stat(folder).st_mtime_ns
+            os.mkdir(os.path.join(folder, "c"))
+            os.utime(folder, ns=(mtime, mtime))
+            self.assertEqual(list(util.list_folder(folder)), reference())
+            open(os.path.join(folder, "d.txt"), "w").close()
+            os.utime(folder, ns=(mtime, mtime))
+            self.assertEqual(len(util.list_folder(folder)), 3)
+        # New file, listed once the cached entries expire
+        with mock.patch.object(util.time, "monotonic", return_value=12.0):
+            self.assertEqual(list(util.list_folder(folder)), reference())
+        self.assertEqual(util.list_folder(os.path.join(folder, "e")), ())
+
+    def test_rescale_image(self):
+        int8_mat = np.int8(self.int_mat % 256 - 128)
+        # Tall array, so the rows are processed in several blocks
+        tall_mat = np.repeat(self.float_mat, 5, axis=0)
+        for mat in [self.float_mat, self.int_mat, self.uint_mat, int8_mat,
+                    tall_mat]:
+            nmin, nmax = np.float64(np.min(mat)), np.float64(np.max(mat))
+            mat1 = np.uint8(255.0 * (np.float64(mat) - nmin) / (nmax - nmin))
+            self.assertTrue(np.array_equal(util.rescale_image(mat), mat1),
+                            msg=f"Data type: {mat.dtype}")
+        mat = np.full((20, 30), 7.0)
+        self.assertTrue(np.array_equal(util.rescale_image(mat),
+                                       np.zeros((20, 30), dtype=np.uint8)))
+
+    def test_get_chunk_read_size(self):
+        file_path = os.path.join(self.tmp_folder, "chunks.hdf")
+        with h5py.File(file_path, "w") as hdf_obj:
+            data_obj = hdf_obj.create_dataset("data", (50, 60, 70), "u2",
+                                              chunks=(8, 16, 32))
+            for axis in range(3):
+                # Chunks intersecting the middle slice, as given by h5py
+                selection = [slice(None)] * 3
+                selection[axis] = 25
+                num_chunks = len(list(data_obj.iter_chunks(
+                    tuple(selection))))
+                self.assertEqual(util.get_chunk_read_size(data_obj, axis),
+                                 num_chunks * 8 * 16 * 32 * 2,
+                                 msg=f"Axis: {axis}")
+            data_obj = hdf_obj.create_dataset("contiguous", (5, 6, 7), "f4")
+            self.assertIsNone(util.get_chunk_read_size(data_obj, 2))
+
+    def test_get_hdf_tree_branch(self):
+        file_path = os.path.join(self.tmp_folder, "tree.hdf")
+        with h5py.File(file_path, "w") as hdf_obj:
+            for i in range(3):
+                hdf_obj[f"entry/group{i}/data"] = np.arange(i + 1)
+                hdf_obj[f"entry/value{i}"] = i
+
+        def labels(nodes):
+            # Labels of all nodes, walked depth-first
+            return [label for node in nodes for label in
+                    [node["label"]] + labels(node.get("children", []))]
+
+        with h5py.File(file_path, "r") as hdf_obj:
+            visited = []
+            hdf_obj["entry"].visit(visited.append)
+        branch = util.get_hdf_tree_branch(file_path, "entry")
+        self.assertEqual(sorted(labels(branch)),
+                         sorted(f"entry/{name}" for name in visited))
+        tree = util.hdf_tree_to_dict(file_path)[0]["children"]
+        self.assertEqual(branch, tree[0]["children"])
+        # Groups which are not walked are replaced by a placeholder node
+        branch = util.get_hdf_tree_branch(file_path, "entry", max_nodes=4)
+        self.assertEqual(branch[0]["children"],
+                         [{"id": "...", "label": "entry/group0/"}])
+        self.assertIsInstance(util.get_hdf_tree_branch(file_path, "missing"),
+                              str)
+
+    def test_get_file_version(self):
+        file_path = os.path.join(self.tmp_folder, "file.txt")
+        with open(file_path, "w") as file:
+            file.write("abc")
+        file_stat = os.stat(file_path)
+        version = util.get_file_version(file_path)
+        self.assertEqual(version, (file_stat.st_mtime_ns, file_stat.st_size))
+        # Appended within the resolution of the modification time
+        with open(file_path, "a") as file:
+            file.write("d")
+        os.utime(file_path, ns=(file_stat.st_atime_ns, file_stat.st_mtime_ns))
+        self.assertNotEqual(util.get_file_version(file_path), version)
+        missing_path = os.path.join(self.tmp_folder, "missing.txt")
+        self.assertEqual(util.get_file_versions([missing_path, file_path,
+                                                 file_path]),
+                         ((file_path, util.get_file_version(file_path)),
+                          (missing_path, None)))